@@ -1,5 +1,6 @@
 import cv2
-from managers import WindowManager, CaptureManager
+import argparse
+from managers import WindowManager, StreamManager, CaptureManager
 import filters
 from filters import ChannelMixing
 import rects
@@ -7,8 +8,11 @@ from trackers import FaceTracker
 
 class Cameo(object):
 
-    def __init__(self):
-        self._windowManager = WindowManager('Cameo',self.onKeypress)
+    def __init__(self, headless = False, rawPipe = None):
+        if headless:
+            self._windowManager = StreamManager(self.onKeypress, rawPipe = rawPipe)
+        else:
+            self._windowManager = WindowManager('Cameo',self.onKeypress)
         self._captureManager = CaptureManager(cv2.VideoCapture(0),self._windowManager,False)
         self._channel_mixing_filter = ChannelMixing()
         self._faceTracker = FaceTracker()
@@ -76,7 +80,13 @@ class Cameo(object):
             self._windowManager.destroyWindow()
     
 if __name__=="__main__":
-    Cameo().run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--headless', action='store_true',
+                        help='stream frames over HTTP instead of opening a window')
+    parser.add_argument('--raw-pipe', metavar='PATH',
+                        help='with --headless, also write raw frames to a file or FIFO')
+    args = parser.parse_args()
+    Cameo(headless = args.headless, rawPipe = args.raw_pipe).run()
 
 
 
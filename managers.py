@@ -1,6 +1,15 @@
 import cv2
 import numpy
 import time
+import os
+import stat
+import errno
+import logging
+import threading
+import queue
+import socketserver
+import http.server
+from concurrent.futures import ThreadPoolExecutor
 
 class CaptureManager(object):
 
@@ -164,4 +173,265 @@ class WindowManager(object):
             #discard any non-ASCII info encoded by GTK
             keycode &= 0xFF
             self.keypressCallback(keycode)
-    
\ No newline at end of file
+
+class _MJPEGHandler(http.server.BaseHTTPRequestHandler):
+    """Stream the latest encoded frame to one HTTP client"""
+
+    def do_GET(self):
+        manager = self.server.manager
+        self.send_response(200)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+        self.end_headers()
+
+        manager._addClient(1)
+        try:
+            seq = -1
+            while manager.isWindowCreated:
+                #Only ever wait for the newest frame; a slow client just skips frames
+                jpeg, seq = manager._waitForJpeg(seq)
+                if jpeg is None:
+                    continue
+                self.wfile.write(b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n' % len(jpeg))
+                self.wfile.write(jpeg)
+                self.wfile.write(b'\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            manager._addClient(-1)
+
+    def log_message(self, format, *args):
+        pass
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    """Read one command per line and queue it as a keycode"""
+
+    keycodes = {'space': 32, 'tab': 9, 'esc': 27, 'escape': 27}
+
+    def handle(self):
+        for line in self.rfile:
+            command = line.decode('ascii', 'ignore').strip()
+            if command in self.keycodes:
+                self.server.manager._commands.put(self.keycodes[command])
+            elif len(command) == 1:
+                self.server.manager._commands.put(ord(command))
+
+class _ControlServer(socketserver.ThreadingTCPServer):
+    #Quitting with a client still connected leaves the port in TIME_WAIT
+    allow_reuse_address = True
+    daemon_threads = True
+
+class RawFrameSink(object):
+    """Write raw frame bytes to a file or named pipe on a background thread.
+        Only the latest frame is kept, so a slow reader never blocks the caller.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._fd = None
+        self._closed = threading.Event()
+
+        #Open here so a bad path is reported to the caller.
+        #A FIFO without a reader yet is opened later by the writer thread.
+        self._isFifo = os.path.exists(path) and stat.S_ISFIFO(os.stat(path).st_mode)
+        if self._isFifo:
+            self._fd = self._openFifo()
+        else:
+            self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+        self._frames = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, frame):
+        #Skip the copy while no reader is attached or the writer has stopped
+        if self._fd is None or not self._thread.is_alive():
+            return
+        #Snapshot the frame; the caller may reuse its buffer after show()
+        self._put(numpy.array(frame, copy=True, order='C'))
+
+    def close(self, timeout = 1.0):
+        self._closed.set()
+        self._put(None)
+        self._thread.join(timeout)
+
+    def _put(self, item):
+        try:
+            self._frames.get_nowait() #drop a frame the reader has not taken yet
+        except queue.Empty:
+            pass
+        self._frames.put_nowait(item)
+
+    def _openFifo(self):
+        """Return a blocking fd for the FIFO, or None if no reader is connected yet"""
+        try:
+            fd = os.open(self._path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return None
+            raise
+        os.set_blocking(fd, True)
+        return fd
+
+    def _run(self):
+        try:
+            while True:
+                #Poll for a FIFO reader rather than block in open(), so close() still works
+                while self._fd is None:
+                    if self._closed.wait(0.1):
+                        return
+                    self._fd = self._openFifo()
+                try:
+                    self._writeFrames()
+                    return
+                except BrokenPipeError:
+                    if not self._isFifo:
+                        raise
+                    #The reader went away; serve the next one that opens the FIFO
+                    os.close(self._fd)
+                    self._fd = None
+        except OSError as e:
+            logging.getLogger(__name__).warning('Raw frame sink %s stopped: %s', self._path, e)
+        finally:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _writeFrames(self):
+        while True:
+            frame = self._frames.get()
+            if frame is None:
+                return
+            view = memoryview(frame).cast('B')
+            while view:
+                view = view[os.write(self._fd, view):]
+
+class StreamManager(object):
+    """Headless alternative to WindowManager.
+        Serves frames as an MJPEG stream over HTTP, optionally writes raw frames
+        to a pipe, and takes keypress commands, one per line, over a local socket.
+        The control socket binds to controlHost, loopback by default, even when
+        host exposes the stream to the network.
+    """
+
+    def __init__(self, keypressCallback = None, host = '127.0.0.1', port = 8080,
+                 controlHost = '127.0.0.1', controlPort = 8081, rawPipe = None,
+                 jpegQuality = 80, numEncoders = 2):
+        self.keypressCallback = keypressCallback
+        self.host = host
+        self.port = port
+        self.controlHost = controlHost
+        self.controlPort = controlPort
+        self.rawPipe = rawPipe
+        self.jpegQuality = jpegQuality
+        self.numEncoders = numEncoders
+        self._isWindowCreated = False
+
+        self._lock = threading.Lock()
+        self._jpegReady = threading.Condition(self._lock)
+        self._jpeg = None
+        self._jpegSeq = -1
+        self._frameSeq = -1
+        self._pendingEncodes = 0
+        self._numClients = 0
+
+        self._commands = queue.SimpleQueue()
+        self._encoders = None
+        self._httpServer = None
+        self._controlServer = None
+        self._rawSink = None
+
+    @property
+    def isWindowCreated(self):
+        return self._isWindowCreated
+
+    def createWindow(self):
+        self._httpServer = self._controlServer = None
+        try:
+            self._httpServer = http.server.ThreadingHTTPServer((self.host, self.port), _MJPEGHandler)
+            self._controlServer = _ControlServer((self.controlHost, self.controlPort), _ControlHandler)
+            if self.rawPipe is not None:
+                self._rawSink = RawFrameSink(self.rawPipe)
+        except BaseException:
+            #Release whatever was bound before the failure
+            for server in (self._httpServer, self._controlServer):
+                if server is not None:
+                    server.server_close()
+            self._httpServer = self._controlServer = None
+            raise
+
+        self._encoders = ThreadPoolExecutor(self.numEncoders)
+        for server in (self._httpServer, self._controlServer):
+            server.manager = self
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        self._isWindowCreated = True
+
+    def show(self, frame):
+        """Hand the frame to the encoders and sinks without waiting on them"""
+        if not self._isWindowCreated:
+            return
+
+        with self._lock:
+            #Skip encoding when nobody watches or every encoder is still busy
+            shouldEncode = self._numClients > 0 and self._pendingEncodes < self.numEncoders
+            if shouldEncode:
+                self._pendingEncodes += 1
+                self._frameSeq += 1
+                seq = self._frameSeq
+        if shouldEncode:
+            try:
+                self._encoders.submit(self._encode, frame.copy(), seq)
+            except RuntimeError:
+                #The executor was shut down; undo the bookkeeping for this frame
+                with self._lock:
+                    self._pendingEncodes -= 1
+
+        if self._rawSink is not None:
+            self._rawSink.write(frame)
+
+    def destroyWindow(self):
+        self._isWindowCreated = False
+        with self._jpegReady:
+            self._jpegReady.notify_all()
+        for server in (self._httpServer, self._controlServer):
+            server.shutdown()
+            server.server_close()
+        self._encoders.shutdown(wait=False)
+        if self._rawSink is not None:
+            self._rawSink.close()
+            self._rawSink = None
+
+    def processEvents(self):
+        """Dispatch queued control commands; never blocks"""
+        while True:
+            try:
+                keycode = self._commands.get_nowait()
+            except queue.Empty:
+                return
+            if self.keypressCallback is not None:
+                self.keypressCallback(keycode)
+
+    def _encode(self, frame, seq):
+        try:
+            ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpegQuality])
+            with self._jpegReady:
+                #Encoders may finish out of order; keep only the newest frame
+                if ok and seq > self._jpegSeq:
+                    self._jpeg = buf.tobytes()
+                    self._jpegSeq = seq
+                    self._jpegReady.notify_all()
+        finally:
+            with self._lock:
+                self._pendingEncodes -= 1
+
+    def _waitForJpeg(self, lastSeq, timeout = 1.0):
+        """Return the newest JPEG shared by all clients once it is newer than lastSeq"""
+        with self._jpegReady:
+            self._jpegReady.wait_for(lambda: self._jpegSeq > lastSeq or not self._isWindowCreated, timeout)
+            if self._jpegSeq > lastSeq:
+                return self._jpeg, self._jpegSeq
+            return None, lastSeq
+
+    def _addClient(self, delta):
+        with self._lock:
+            self._numClients += delta
@@ -1,4 +1,5 @@
 import cv2
+import numpy
 
 def outlineRect(image, rect, color):
     if rect is None:
@@ -6,6 +7,24 @@ def outlineRect(image, rect, color):
     x, y, w, h = rect
     cv2.rectangle(image,(x,y),(x+w,y+h),color)
 
+def iouMatrix(rectsA, rectsB):
+    """Return the intersection-over-union of every pair of (x, y, w, h) rects
+        Result has shape (len(rectsA), len(rectsB))
+    """
+    a = numpy.asarray(rectsA, numpy.float32).reshape(-1, 4)
+    b = numpy.asarray(rectsB, numpy.float32).reshape(-1, 4)
+
+    #Broadcast a as a column and b as a row to compare all pairs at once
+    ax0, ay0, aw, ah = a[:, 0:1], a[:, 1:2], a[:, 2:3], a[:, 3:4]
+    bx0, by0, bw, bh = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+
+    interW = numpy.minimum(ax0 + aw, bx0 + bw) - numpy.maximum(ax0, bx0)
+    interH = numpy.minimum(ay0 + ah, by0 + bh) - numpy.maximum(ay0, by0)
+    inter = numpy.clip(interW, 0, None) * numpy.clip(interH, 0, None)
+    union = aw * ah + bw * bh - inter
+
+    return numpy.divide(inter, union, out=numpy.zeros_like(inter), where=union > 0)
+
 def copyRect(src, dst, srcRect, dstRect, interpolation = cv2.INTER_LINEAR):
     """Copy part of the source to part of the destination"""
 
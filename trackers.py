@@ -1,27 +1,199 @@
 import cv2
+import numpy
 import rects
 import utils
 
+#Feature indices into the track store's rect arrays
+FACE, LEFT_EYE, RIGHT_EYE, NOSE, MOUTH = range(5)
+NUM_FEATURES = 5
+
+class FaceTrackStore(object):
+    """Preallocated arrays of tracked faces, matched across frames by IoU.
+        Each slot holds one track: a stable id, age and miss counters,
+        the latest face and feature rects, and a short history of face rects.
+        A track's age counts the updates it was matched in since it started;
+        its misses count the consecutive updates it was not.
+    """
+
+    def __init__(self, capacity = 16, historyLength = 8, minIoU = 0.3, maxMisses = 5):
+        self.capacity = capacity
+        self.historyLength = historyLength
+        self.minIoU = minIoU
+        self.maxMisses = maxMisses
+
+        self._rects = numpy.zeros((capacity, NUM_FEATURES, 4), numpy.int32)
+        self._hasRect = numpy.zeros((capacity, NUM_FEATURES), bool)
+        self._active = numpy.zeros(capacity, bool)
+        self._ids = numpy.full(capacity, -1, numpy.int64)
+        self._ages = numpy.zeros(capacity, numpy.int32)
+        self._misses = numpy.zeros(capacity, numpy.int32)
+        self._history = numpy.zeros((capacity, historyLength, 4), numpy.int32)
+        self._historyCount = numpy.zeros(capacity, numpy.int64)
+
+        self._nextId = 0
+
+    def update(self, faceRects):
+        """Match detected face rects to tracks and return the slot of each
+            detection; -1 if the store is full and it could not be tracked
+        """
+        faceRects = numpy.asarray(faceRects, numpy.int32).reshape(-1, 4)
+        numDetections = len(faceRects)
+        detectionSlots = numpy.full(numDetections, -1, numpy.intp)
+
+        activeSlots = numpy.flatnonzero(self._active)
+        trackMatched = numpy.zeros(len(activeSlots), bool)
+
+        if numDetections > 0 and len(activeSlots) > 0:
+            iou = rects.iouMatrix(faceRects, self._rects[activeSlots, FACE])
+            #Greedy assignment, best overlapping pair first
+            for _ in range(min(numDetections, len(activeSlots))):
+                d, t = numpy.unravel_index(numpy.argmax(iou), iou.shape)
+                if iou[d, t] < self.minIoU:
+                    break
+                detectionSlots[d] = activeSlots[t]
+                trackMatched[t] = True
+                iou[d, :] = -1
+                iou[:, t] = -1
+
+        #Age matched tracks; count misses on the rest and drop stale ones
+        self._ages[activeSlots[trackMatched]] += 1
+        missed = activeSlots[~trackMatched]
+        self._misses[activeSlots[trackMatched]] = 0
+        self._misses[missed] += 1
+        self._active[missed[self._misses[missed] > self.maxMisses]] = False
+
+        #Start new tracks for unmatched detections, while there is room
+        for d in numpy.flatnonzero(detectionSlots < 0):
+            free = numpy.flatnonzero(~self._active)
+            if len(free) == 0:
+                break
+            slot = free[0]
+            self._active[slot] = True
+            self._ids[slot] = self._nextId
+            self._nextId += 1
+            self._ages[slot] = 0
+            self._misses[slot] = 0
+            self._historyCount[slot] = 0
+            self._hasRect[slot] = False #forget the features of the slot's last track
+            detectionSlots[d] = slot
+
+        for d, slot in enumerate(detectionSlots):
+            if slot < 0:
+                continue
+            self.setRect(slot, FACE, faceRects[d])
+            self._history[slot, self._historyCount[slot] % self.historyLength] = faceRects[d]
+            self._historyCount[slot] += 1
+
+        return detectionSlots
+
+    def setRect(self, slot, feature, rect):
+        """Store a rect for one feature of a track; None clears it"""
+        if rect is None:
+            self._hasRect[slot, feature] = False
+            return
+        self._rects[slot, feature] = rect
+        self._hasRect[slot, feature] = True
+
+    def getRect(self, slot, feature):
+        """Return a feature rect of a track as an (x, y, w, h) tuple, or None"""
+        if not self._hasRect[slot, feature]:
+            return None
+        return tuple(self._rects[slot, feature].tolist())
+
+    def visibleSlots(self):
+        """Return the slots of tracks detected in the last update, ordered by id"""
+        slots = numpy.flatnonzero(self._active & (self._misses == 0))
+        return slots[numpy.argsort(self._ids[slots], kind='stable')]
+
+    def slotOf(self, faceId):
+        """Return the slot tracking a face id, or None"""
+        slots = numpy.flatnonzero(self._active & (self._ids == faceId))
+        if len(slots) == 0:
+            return None
+        return int(slots[0])
+
+    def history(self, faceId, n = None):
+        """Return up to n most recent face rects of a track, oldest first"""
+        slot = self.slotOf(faceId)
+        if slot is None:
+            return numpy.empty((0, 4), numpy.int32)
+        count = int(min(self._historyCount[slot], self.historyLength))
+        if n is not None:
+            count = min(count, n)
+        end = int(self._historyCount[slot])
+        indices = numpy.arange(end - count, end) % self.historyLength
+        return self._history[slot, indices]
+
+    def hasMoved(self, faceId, minIoU = 0.9):
+        """Return True unless the face rect overlaps its previous one by at least minIoU.
+            New or unknown faces count as moved.
+        """
+        recent = self.history(faceId, 2)
+        if len(recent) < 2:
+            return True
+        return bool(rects.iouMatrix(recent[0], recent[1])[0, 0] < minIoU)
+
 class Face(object):
-    """Data on facial features; face, eyes, nose, mouth"""
+    """Data on facial features; face, eyes, nose, mouth.
+        A lightweight view onto one slot of a FaceTrackStore,
+        valid until the next update of the tracker.
+    """
 
-    def __init__(self):
-        self.faceRect = None
-        self.leftEyeRect = None
-        self.rightEyeRect = None
-        self.noseRect = None
-        self.mouthRect = None
+    __slots__ = ('_store', '_slot')
+
+    def __init__(self, store, slot):
+        self._store = store
+        self._slot = slot
+
+    @property
+    def faceId(self):
+        return int(self._store._ids[self._slot])
+
+    @property
+    def age(self):
+        return int(self._store._ages[self._slot])
+
+    @property
+    def misses(self):
+        return int(self._store._misses[self._slot])
+
+    @property
+    def faceRect(self):
+        return self._store.getRect(self._slot, FACE)
+
+    @property
+    def leftEyeRect(self):
+        return self._store.getRect(self._slot, LEFT_EYE)
+
+    @property
+    def rightEyeRect(self):
+        return self._store.getRect(self._slot, RIGHT_EYE)
+
+    @property
+    def noseRect(self):
+        return self._store.getRect(self._slot, NOSE)
+
+    @property
+    def mouthRect(self):
+        return self._store.getRect(self._slot, MOUTH)
+
+    def hasMoved(self, minIoU = 0.9):
+        """Return True unless the face stayed put since the previous detection"""
+        return self._store.hasMoved(self.faceId, minIoU)
 
 class FaceTracker(object):
     """A tracker for facial features: face, eyes, nose, mouth"""
 
-    def __init__(self,scaleFactor = 1.2, minNeighbors = 2, flags = cv2.CASCADE_SCALE_IMAGE):
+    def __init__(self,scaleFactor = 1.2, minNeighbors = 2, flags = cv2.CASCADE_SCALE_IMAGE,
+                 maxFaces = 16, historyLength = 8, minIoU = 0.3, maxMisses = 5):
         
         self.scaleFactor = scaleFactor
         self.minNeighbors = minNeighbors
         self.flags = flags
 
-        self._faces = [] #List of tracked faces
+        self._store = FaceTrackStore(maxFaces, historyLength, minIoU, maxMisses)
+        self._views = [Face(self._store, slot) for slot in range(maxFaces)]
+        self._faces = [] #List of faces seen in the last update, ordered by id
 
         self._faceClassifier = cv2.CascadeClassifier('cascades/haarcascade_frontalface_alt.xml')
         self._eyeClassifier = cv2.CascadeClassifier('cascades/haarcascade_eye.xml')
@@ -32,12 +204,15 @@ class FaceTracker(object):
     def faces(self):
         """The tracked facial features"""
         return self._faces
+
+    @property
+    def store(self):
+        """The underlying track store, for per-face history queries"""
+        return self._store
     
     def update(self, image):
         """Update the tracked facial features"""
 
-        self._faces = []
-
         if not utils.isGray(image):
             image = cv2.cvtColor(image,cv2.COLOR_BGR2GRAY)
         image = cv2.equalizeHist(image)
@@ -47,35 +222,43 @@ class FaceTracker(object):
 
         faceRects = self._faceClassifier.detectMultiScale(image, self.scaleFactor,
                                                           self.minNeighbors)#, self.flags,minSize)
-        
-        if faceRects is not None:
-            for faceRect in faceRects:
-                face = Face()
-                face.faceRect = faceRect
-
-                x,y,w,h = faceRect
-
-                #Seek an eye in the upper-left part of the face
-                searchRect = (x+w/7,y,w*2/7,h/2)
-                face.leftEyeRect = self._detectOneObject(self._eyeClassifier,
-                                                         image,searchRect,64)
-                
-                #Seek an eye in the upper-right part of the face
-                searchRect = (x+w*4/7, y, w*2/7, h/2)
-                face.rightEyeRect = self._detectOneObject(
-                self._eyeClassifier, image, searchRect, 64)
-                
-                # Seek a nose in the middle part of the face.
-                searchRect = (x+w/4, y+h/4, w/2, h/2)
-                face.noseRect = self._detectOneObject(
-                self._noseClassifier, image, searchRect, 32)
-                
-                # Seek a mouth in the lower-middle part of the face.
-                searchRect = (x+w/6, y+h*2/3, w*2/3, h/3)
-                face.mouthRect = self._detectOneObject(
-                self._mouthClassifier, image, searchRect, 16)
-
-                self._faces.append(face)
+        if faceRects is None:
+            faceRects = ()
+
+        slots = self._store.update(faceRects)
+
+        for faceRect, slot in zip(faceRects, slots):
+            if slot < 0:
+                continue
+
+            #A face that stayed put keeps the features found for it last time
+            if not self._views[slot].hasMoved():
+                continue
+
+            x,y,w,h = faceRect
+
+            #Seek an eye in the upper-left part of the face
+            searchRect = (x+w/7,y,w*2/7,h/2)
+            self._store.setRect(slot, LEFT_EYE, self._detectOneObject(
+            self._eyeClassifier, image, searchRect, 64))
+            
+            #Seek an eye in the upper-right part of the face
+            searchRect = (x+w*4/7, y, w*2/7, h/2)
+            self._store.setRect(slot, RIGHT_EYE, self._detectOneObject(
+            self._eyeClassifier, image, searchRect, 64))
+            
+            # Seek a nose in the middle part of the face.
+            searchRect = (x+w/4, y+h/4, w/2, h/2)
+            self._store.setRect(slot, NOSE, self._detectOneObject(
+            self._noseClassifier, image, searchRect, 32))
+            
+            # Seek a mouth in the lower-middle part of the face.
+            searchRect = (x+w/6, y+h*2/3, w*2/3, h/3)
+            self._store.setRect(slot, MOUTH, self._detectOneObject(
+            self._mouthClassifier, image, searchRect, 16))
+
+        #Stable order by id, so swapRects swaps the same pairs every frame
+        self._faces = [self._views[slot] for slot in self._store.visibleSlots()]
             
     def _detectOneObject(self,classifier,image,rect,imageSizeToMinSizeRatio):
 